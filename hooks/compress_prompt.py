@@ -4,17 +4,63 @@ Claude Code Hook: UserPromptSubmit - Auto-compress JSON before LLM
 
 This hook uses the OFFICIAL toon-python library for compression.
 Requires: pip install toon-python
+Optional: pip install orjson (faster JSON parsing and serialization)
 
 This version intercepts user prompts BEFORE they reach the LLM.
 When it detects JSON data, it automatically compresses it to Toon format.
 """
 
+import atexit
 import json
+import os
 import sys
 import re
 import subprocess
+from datetime import datetime
 from pathlib import Path
-from typing import Any, List, Dict, Tuple
+from typing import Any, List, Dict, Optional, Tuple, Union
+
+# Debug log location, resolved once at import
+LOG_PATH = Path.home() / ".claude" / "tooner_hook.log"
+# Process pool start-up costs more than encoding a few small blocks, so only
+# prompts with several blocks and a large JSON payload are encoded in parallel
+PARALLEL_MIN_BLOCKS = 4
+PARALLEL_MIN_CHARS = 256 * 1024
+
+# Log files stay open for the life of the process; one write() per message
+_log_fds: Dict[Path, int] = {}
+
+# orjson reads integers wider than 64 bits as floats, which would change
+# the numbers written back into the prompt; such text goes to the stdlib
+_LONG_INT_RE = re.compile(r'[0-9]{20}')
+_LONG_INT_BYTES_RE = re.compile(rb'[0-9]{20}')
+
+# Prefer orjson when installed; both paths emit compact, unescaped UTF-8 JSON
+try:
+    import orjson
+
+    def json_loads(text: Union[str, bytes]) -> Any:
+        pattern = _LONG_INT_RE if isinstance(text, str) else _LONG_INT_BYTES_RE
+        if pattern.search(text):
+            return json.loads(text)
+        return orjson.loads(text)
+
+    def json_dumps(data: Any) -> str:
+        try:
+            return orjson.dumps(data).decode()
+        except TypeError:
+            # Integers wider than 64 bits - the stdlib handles those
+            return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+except ImportError:
+    json_loads = json.loads
+
+    def json_dumps(data: Any) -> str:
+        return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+# Structural JSON characters, compiled once for every hook invocation
+_STRUCTURAL_RE = re.compile(r'[\[\]{}"\\\n]')
+# Every array of objects or object we compress contains an opening '{"'
+_JSON_HINT_RE = re.compile(r'\{\s*"')
 
 # Auto-detect if we need to switch to a different Python interpreter
 def find_python_with_toon():
@@ -48,12 +94,42 @@ def find_python_with_toon():
 
     return None
 
-# If toon_python is not available in current interpreter, try to re-exec with correct one
-try:
-    from toon_python import encode
-    TOON_AVAILABLE = True
-except ImportError:
-    # Try to find a Python that has toon-python
+# toon-python is imported on first use, so prompts without JSON never pay for it
+encode = None
+TOON_AVAILABLE = False
+
+
+def load_toon() -> bool:
+    """
+    Import toon-python into this interpreter on first call.
+
+    Returns:
+        bool: True if the encoder is available
+    """
+    global encode, TOON_AVAILABLE
+
+    if not TOON_AVAILABLE:
+        try:
+            from toon_python import encode
+            TOON_AVAILABLE = True
+        except ImportError:
+            # Don't print error to stderr - it's annoying. Just log it.
+            # The hook will gracefully pass through without compression.
+            pass
+
+    return TOON_AVAILABLE
+
+
+def reexec_with_toon(raw_input: bytes):
+    """
+    Re-run this script under a Python interpreter that has toon-python.
+
+    Exits with the child's return code on success; returns if no suitable
+    interpreter is found.
+
+    Args:
+        raw_input: Original hook input, replayed to the child on stdin
+    """
     correct_python = find_python_with_toon()
 
     if correct_python and correct_python != sys.executable:
@@ -61,7 +137,7 @@ except ImportError:
         try:
             result = subprocess.run(
                 [correct_python, __file__] + sys.argv[1:],
-                stdin=sys.stdin,
+                input=raw_input,
                 stdout=sys.stdout,
                 stderr=sys.stderr
             )
@@ -69,11 +145,6 @@ except ImportError:
         except Exception:
             pass
 
-    # If we're still here, toon-python is not available
-    TOON_AVAILABLE = False
-    # Don't print error to stderr - it's annoying. Just log it.
-    # The hook will gracefully pass through without compression.
-
 
 # ============================================================================
 # HELPER FUNCTIONS
@@ -81,9 +152,14 @@ except ImportError:
 
 def estimate_tokens(text: str) -> int:
     """
-    Rough token estimation (approx 1 token per 4 characters for English text).
+    Rough token estimation (approx 1 token per 4 UTF-8 bytes).
+
+    Non-ASCII text (CJK, emoji) costs more tokens per character, so it is
+    sized by its encoded length rather than its character count.
     """
-    return len(text) // 4
+    if text.isascii():
+        return len(text) // 4
+    return len(text.encode('utf-8', errors='ignore')) // 4
 
 
 def is_uniform_array(data: Any) -> bool:
@@ -93,12 +169,58 @@ def is_uniform_array(data: Any) -> bool:
     if not isinstance(data, list) or len(data) == 0:
         return False
 
-    if not all(isinstance(item, dict) for item in data):
+    first = data[0]
+    if type(first) is not dict:
         return False
 
-    # Check if all objects have the same keys
-    first_keys = set(data[0].keys())
-    return all(set(item.keys()) == first_keys for item in data)
+    # Compare key views directly - no temporary sets are built per item
+    first_keys = first.keys()
+    size = len(first)
+    return all(
+        type(item) is dict and len(item) == size and item.keys() == first_keys
+        for item in data
+    )
+
+
+def _estimate_sizes(data: List[Dict], name: str = "data") -> Optional[Tuple[int, int]]:
+    """
+    Estimate compact JSON and Toon UTF-8 sizes of a uniform array in one walk.
+
+    Args:
+        data: Uniform array of flat objects
+        name: Name used for the Toon header
+
+    Returns:
+        tuple: (json_size, toon_size), or None if a value is nested and
+        cannot be sized without encoding
+    """
+    keys = data[0]
+    # JSON repeats '"key":' plus a ',' separator for every field of every row,
+    # and wraps each row in braces; the outer brackets minus the one missing
+    # row separator leave 1
+    json_row = sum(len(k) + 4 for k in keys) + 2
+    json_size = 1
+    # Toon writes the keys once in the header, then one indented line per row
+    toon_size = len(name) + len(str(len(data))) + sum(len(k) + 1 for k in keys) + 4
+
+    for row in data:
+        json_size += json_row
+        toon_size += 3
+        for value in row.values():
+            if isinstance(value, str):
+                size = len(value)
+                if not value.isascii():
+                    size = len(value.encode('utf-8', errors='ignore'))
+                json_size += size + 2
+                toon_size += size + 1
+            elif isinstance(value, (dict, list)):
+                return None
+            else:
+                size = len(str(value))
+                json_size += size
+                toon_size += size + 1
+
+    return json_size, toon_size
 
 
 def json_to_toon_official(data: Any, name: str = "data") -> str:
@@ -110,10 +232,10 @@ def json_to_toon_official(data: Any, name: str = "data") -> str:
         name: Name for the data structure
 
     Returns:
-        Toon formatted string
+        Toon formatted string, or compact JSON if Toon encoding is unavailable
     """
     if not TOON_AVAILABLE:
-        return json.dumps(data, indent=2)
+        return json_dumps(data)
 
     try:
         # For arrays, wrap in a named object for better context
@@ -125,84 +247,216 @@ def json_to_toon_official(data: Any, name: str = "data") -> str:
     except Exception as e:
         # Fallback to JSON if encoding fails
         log_to_file(f"Toon encoding failed: {e}, falling back to JSON")
-        return json.dumps(data, indent=2)
+        # Compact JSON never beats itself, so the block is left uncompressed
+        return json_dumps(data)
 
 
 # ============================================================================
 # HOOK LOGIC
 # ============================================================================
 
+def find_json_spans(text: str) -> List[Tuple[int, int, list]]:
+    """
+    Find candidate JSON substrings in a single pass over the text.
+
+    Tracks bracket nesting, string state and escapes, and emits a span each
+    time a bracket closes. A quote only opens a string where JSON allows
+    one, so quotes in prose do not swallow the rest of the line. Every span
+    keeps the spans closed directly inside it, so a wrapper that is not
+    itself compressible (e.g. {"users": [...]}) can fall back to its
+    contents. Spans closed inside a bracket that is
+    never terminated (e.g. a stray "[" in prose) are promoted to the top
+    level at the end, so no part of the text is scanned twice.
+
+    Returns:
+        list of tuples: [(start_pos, end_pos, child_spans), ...] in text order
+    """
+    spans = []
+    # Each open bracket keeps the spans closed directly inside it
+    stack: List[Tuple[int, list]] = []
+    in_string = False
+    escaped_at = -1
+
+    # Only structural characters matter; everything else is skipped in C
+    for match in _STRUCTURAL_RE.finditer(text):
+        char = match.group()
+        i = match.start()
+        if in_string:
+            if i == escaped_at:
+                continue
+            if char == '\\':
+                escaped_at = i + 1
+            elif char == '"' or char == '\n':
+                # JSON strings cannot span lines - a newline means the quote was prose
+                in_string = False
+        elif char == '[' or char == '{':
+            stack.append((i, []))
+        elif char == ']' or char == '}':
+            if stack:
+                start, children = stack.pop()
+                (stack[-1][1] if stack else spans).append((start, i + 1, children))
+        elif char == '"' and stack:
+            # JSON strings only open after '[', '{', ',' or ':'; any other
+            # quote is prose (e.g. a 27" monitor) and must not hide what follows.
+            # The open bracket below it bounds the lookback
+            j = i - 1
+            while text[j] in ' \t\r\n':
+                j -= 1
+            if text[j] in '[{,:':
+                in_string = True
+
+    # Brackets left open were not JSON; keep whatever closed inside them
+    for _, children in stack:
+        spans.extend(children)
+
+    return spans
+
+
 def detect_json_in_text(text: str) -> List[Tuple[int, int, Any]]:
     """
     Detect and extract JSON data from text.
 
+    Spans that parse to an array of objects are taken whole. Anything else
+    is searched for nested arrays, so wrapped API responses such as
+    {"data": [...]} still compress.
+
     Returns:
         list of tuples: [(start_pos, end_pos, json_data), ...]
     """
-    json_blocks = []
+    # Plain prose prompts skip the scanner entirely
+    if not _JSON_HINT_RE.search(text):
+        return []
+
+    array_blocks = []
+    object_blocks = []
 
-    # Pattern 1: Look for array patterns
-    array_pattern = r'\[\s*\{[^\]]+\}\s*(?:,\s*\{[^\]]+\}\s*)*\]'
-    for match in re.finditer(array_pattern, text, re.DOTALL):
+    # Depth-first in text order; the flag marks spans inside a kept object
+    pending = [(span, False) for span in reversed(find_json_spans(text))]
+    while pending:
+        (start, end, children), in_object = pending.pop()
         try:
-            data = json.loads(match.group())
-            json_blocks.append((match.start(), match.end(), data))
+            data = json_loads(text[start:end])
         except (json.JSONDecodeError, ValueError):
+            data = None
+
+        if isinstance(data, list) and data and all(isinstance(item, dict) for item in data):
+            array_blocks.append((start, end, data))
             continue
+        if isinstance(data, dict) and len(data) > 2 and not in_object:
+            object_blocks.append((start, end, data))
+            in_object = True
 
-    # Pattern 2: Look for object patterns
-    if not json_blocks:
-        obj_pattern = r'\{[^\}]+\}'
-        for match in re.finditer(obj_pattern, text, re.DOTALL):
-            try:
-                data = json.loads(match.group())
-                if isinstance(data, dict) and len(data) > 2:
-                    json_blocks.append((match.start(), match.end(), data))
-            except (json.JSONDecodeError, ValueError):
-                continue
+        pending.extend((child, in_object) for child in reversed(children))
 
-    return json_blocks
+    # Prefer arrays; fall back to standalone objects
+    return array_blocks or object_blocks
 
 
-def should_compress(data: Any, min_items: int = 3) -> bool:
+def evaluate_compression(
+    data: Any, min_items: int = 3, min_size: int = 64
+) -> Optional[Tuple[str, int, int]]:
     """
-    Determine if data should be compressed.
+    Decide whether data should be compressed and encode it in the same step.
 
     Args:
         data: JSON data
         min_items: Minimum array items to consider compression
+        min_size: Minimum estimated compact JSON size to consider compression
 
     Returns:
-        bool: True if compression would be beneficial
+        tuple: (toon_output, original_tokens, toon_tokens) if compression
+        would be beneficial, otherwise None
     """
     if not TOON_AVAILABLE:
-        return False
+        return None
 
     if not isinstance(data, list):
-        return False
+        return None
 
     if len(data) < min_items:
-        return False
+        return None
 
     if not is_uniform_array(data):
-        return False
+        return None
 
     try:
-        # Calculate potential savings using official library
-        json_str = json.dumps(data)
-        toon_str = json_to_toon_official(data)
+        json_tokens = None
+        estimate = _estimate_sizes(data)
+        if estimate:
+            json_size, toon_size = estimate
+            # Too small for the token savings to matter
+            if json_size < min_size:
+                return None
+            estimated_percent = (json_size - toon_size) / json_size * 100
+            # Far below the threshold - no need to encode anything
+            if estimated_percent < 25:
+                return None
+            # Far above it - the estimate is close enough to skip json.dumps
+            if estimated_percent > 40:
+                json_tokens = json_size // 4
 
-        json_tokens = estimate_tokens(json_str)
-        toon_tokens = estimate_tokens(toon_str)
+        # Calculate potential savings using official library
+        toon_output = json_to_toon_official(data, name="data")
+        if json_tokens is None:
+            json_tokens = estimate_tokens(json_dumps(data))
+        toon_tokens = estimate_tokens(toon_output)
 
         savings_percent = ((json_tokens - toon_tokens) / json_tokens * 100) if json_tokens > 0 else 0
 
         # Only compress if savings > 30%
-        return savings_percent > 30
+        if savings_percent > 30:
+            return toon_output, json_tokens, toon_tokens
+        return None
     except Exception as e:
         # If anything fails during compression check, don't compress
         log_to_file(f"Error checking compression viability: {e}")
-        return False
+        return None
+
+
+def _evaluate_block(args: Tuple[Any, int]) -> Optional[Tuple[str, int, int]]:
+    """
+    Process pool worker: evaluate one JSON block.
+
+    Args:
+        args: (json_data, min_items)
+
+    Returns:
+        Result of evaluate_compression for the block
+    """
+    data, min_items = args
+    load_toon()
+    return evaluate_compression(data, min_items)
+
+
+def evaluate_blocks(json_blocks: List[Tuple[int, int, Any]], min_items: int = 3) -> List:
+    """
+    Evaluate every detected block, in parallel when the payload is large.
+
+    Args:
+        json_blocks: Blocks from detect_json_in_text
+        min_items: Minimum items to trigger compression
+
+    Returns:
+        list: evaluate_compression results, in block order
+    """
+    tasks = [(data, min_items) for _, _, data in json_blocks]
+    workers = min(len(tasks), os.cpu_count() or 1)
+
+    if (
+        workers > 1
+        and len(tasks) >= PARALLEL_MIN_BLOCKS
+        and sum(end - start for start, end, _ in json_blocks) >= PARALLEL_MIN_CHARS
+    ):
+        try:
+            # multiprocessing is slow to import; only large prompts pay for it
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(_evaluate_block, tasks))
+        except Exception as e:
+            log_to_file(f"Parallel evaluation failed: {e}, falling back to sequential")
+
+    return [evaluate_compression(data, min_items) for data, min_items in tasks]
 
 
 def compress_prompt(prompt_text: str, min_items: int = 3) -> Tuple[str, bool, Dict]:
@@ -216,28 +470,27 @@ def compress_prompt(prompt_text: str, min_items: int = 3) -> Tuple[str, bool, Di
     Returns:
         tuple: (modified_text, was_compressed, stats)
     """
-    if not TOON_AVAILABLE:
-        return prompt_text, False, {"error": "toon-python not installed"}
-
     json_blocks = detect_json_in_text(prompt_text)
 
     if not json_blocks:
         return prompt_text, False, {}
 
-    # Process blocks in reverse order to maintain positions
-    modified_text = prompt_text
+    # Only load the encoder once there is something to encode
+    if not load_toon():
+        return prompt_text, False, {"error": "toon-python not installed"}
+
+    # Blocks arrive in text order, so the prompt is rebuilt in one forward pass
+    parts = []
+    prev = 0
     compressed_count = 0
     total_savings = 0
 
-    for start, end, data in reversed(json_blocks):
-        if should_compress(data):
-            # Compress to Toon using official library
-            toon_output = json_to_toon_official(data, name="data")
+    results = evaluate_blocks(json_blocks, min_items)
 
-            # Calculate savings
-            original = json.dumps(data, indent=2)
-            original_tokens = estimate_tokens(original)
-            toon_tokens = estimate_tokens(toon_output)
+    for (start, end, _), result in zip(json_blocks, results):
+        if result:
+            # Reuse the Toon output and token counts from the evaluation
+            toon_output, original_tokens, toon_tokens = result
             savings = original_tokens - toon_tokens
 
             # Add explanation
@@ -250,11 +503,16 @@ Original: {original_tokens} tokens → Compressed: {toon_tokens} tokens (Saved {
 [Note: This data was automatically compressed from JSON to Toon format to save tokens]
 """
 
-            # Replace in text
-            modified_text = modified_text[:start] + compressed_text + modified_text[end:]
+            # Copy the text before the block, then the replacement
+            parts.append(prompt_text[prev:start])
+            parts.append(compressed_text)
+            prev = end
             compressed_count += 1
             total_savings += savings
 
+    parts.append(prompt_text[prev:])
+    modified_text = ''.join(parts)
+
     stats = {
         "compressed_blocks": compressed_count,
         "total_tokens_saved": total_savings
@@ -263,7 +521,20 @@ Original: {original_tokens} tokens → Compressed: {toon_tokens} tokens (Saved {
     return modified_text, compressed_count > 0, stats
 
 
-def log_to_file(message: str, log_file: Path = Path.home() / ".claude" / "tooner_hook.log"):
+def _close_logs():
+    """Close log file descriptors opened by log_to_file."""
+    for fd in _log_fds.values():
+        try:
+            os.close(fd)
+        except OSError:
+            pass
+    _log_fds.clear()
+
+
+atexit.register(_close_logs)
+
+
+def log_to_file(message: str, log_file: Path = LOG_PATH):
     """
     Log message to file for debugging.
 
@@ -272,11 +543,14 @@ def log_to_file(message: str, log_file: Path = Path.home() / ".claude" / "tooner
         log_file: Path to log file
     """
     try:
-        log_file.parent.mkdir(parents=True, exist_ok=True)
-        with open(log_file, "a") as f:
-            from datetime import datetime
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            f.write(f"[{timestamp}] {message}\n")
+        fd = _log_fds.get(log_file)
+        if fd is None:
+            # First message for this file: create the directory and open once
+            log_file.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            _log_fds[log_file] = fd
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        os.write(fd, f"[{timestamp}] {message}\n".encode())
     except Exception:
         # Silently fail if logging doesn't work
         pass
@@ -292,13 +566,9 @@ def main():
     original_prompt = ""
 
     try:
-        if not TOON_AVAILABLE:
-            # Don't block the prompt, just log and exit
-            log_to_file("ERROR: toon-python not installed. Install with: pip install toon-python")
-            sys.exit(0)
-
-        # Read hook input
-        input_data = json.load(sys.stdin)
+        # Read hook input as raw bytes in one go and parse without text decoding
+        raw_input = sys.stdin.buffer.read()
+        input_data = json_loads(raw_input)
 
         # Get the prompt
         original_prompt = input_data.get("prompt", "")
@@ -311,6 +581,13 @@ def main():
         # Try to compress JSON in the prompt
         modified_prompt, was_compressed, stats = compress_prompt(original_prompt)
 
+        if "error" in stats:
+            # JSON was found but this interpreter lacks toon-python; try another one
+            reexec_with_toon(raw_input)
+            # Don't block the prompt, just log and exit
+            log_to_file("ERROR: toon-python not installed. Install with: pip install toon-python")
+            sys.exit(0)
+
         if was_compressed:
             # Log to file
             log_msg = f"Compressed {stats['compressed_blocks']} JSON blocks, saved {stats['total_tokens_saved']} tokens (using official toon-python)"
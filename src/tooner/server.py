@@ -3,15 +3,47 @@
 
 This MCP server is for testing and exploration only.
 For production use, install the Tooner hook for Claude Code instead.
+
+Optional: pip install -e ".[fast]" for orjson (faster JSON parsing and serialization)
 """
 
+import csv
+import io
 import json
-from typing import Any, Dict, List, Union
+import math
+import re
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Tuple, Union
 from mcp.server.fastmcp import FastMCP
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Initialize MCP server
 mcp = FastMCP("tooner")
 
+# LRU cache of _analyze results, keyed by name and compact JSON; results whose
+# JSON or Toon text is very large are not cached to bound memory
+_ANALYSIS_CACHE_SIZE = 64
+_ANALYSIS_CACHE_MAX_CHARS = 1_000_000
+_analysis_cache: "OrderedDict[Tuple[str, str], Tuple[str, str, bool, int, int]]" = OrderedDict()
+
+# Digit runs long enough to overflow 64 bits, which orjson would parse as floats
+_LONG_INT_RE = re.compile(r'[0-9]{20}')
+_LONG_INT_BYTES_RE = re.compile(rb'[0-9]{20}')
+
+# First characters of cells that may parse as int or float
+_NUMERIC_START = frozenset("+-.0123456789")
+
+# should_use_toon reasons for uniform arrays: item count, savings percent
+_REASON_RECOMMENDED = (
+    "Uniform array with {} items. Expected savings: ~{}%. Recommended for token efficiency."
+)
+_REASON_MINIMAL = "Uniform array with {} items. Expected savings: ~{}%. Minimal benefit."
+
 
 def estimate_tokens(text: str) -> int:
     """
@@ -21,6 +53,68 @@ def estimate_tokens(text: str) -> int:
     return len(text) // 4
 
 
+def _loads(text: Union[str, bytes]) -> Any:
+    """Parse JSON, using orjson when installed."""
+    if orjson is not None:
+        pattern = _LONG_INT_RE if isinstance(text, str) else _LONG_INT_BYTES_RE
+        # orjson reads integers wider than 64 bits as floats; the stdlib keeps them
+        if not pattern.search(text):
+            return orjson.loads(text)
+    return json.loads(text)
+
+
+def _dumps(data: Any) -> str:
+    """Serialize compact JSON, using orjson when installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data).decode()
+        except TypeError:
+            # e.g. integers wider than 64 bits - the stdlib handles those
+            pass
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False)
+
+
+def _dumps_indent(data: Any) -> str:
+    """Serialize JSON indented by two spaces, using orjson when installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            pass
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+
+def _estimate_json_chars(data: Any) -> int:
+    """
+    Compute the length of compact JSON for data without building it.
+
+    Matches _dumps(data) exactly for data whose strings need no JSON
+    escaping; close otherwise.
+
+    Args:
+        data: JSON data to measure
+
+    Returns:
+        Estimated character count
+    """
+    if isinstance(data, str):
+        return len(data) + 2
+    if data is True or data is None:
+        return 4
+    if data is False:
+        return 5
+    if isinstance(data, dict):
+        if not data:
+            return 2
+        # Braces, ',' separators, then '"key":' and the value per entry
+        return 1 + len(data) * 4 + sum(len(k) + _estimate_json_chars(v) for k, v in data.items())
+    if isinstance(data, list):
+        if not data:
+            return 2
+        return 1 + len(data) + sum(_estimate_json_chars(v) for v in data)
+    return len(repr(data))
+
+
 def is_uniform_array(data: Any) -> bool:
     """
     Check if data is a uniform array of objects (ideal for Toon compression).
@@ -31,18 +125,102 @@ def is_uniform_array(data: Any) -> bool:
     Returns:
         True if data is a uniform array suitable for Toon compression
     """
-    if not isinstance(data, list) or len(data) == 0:
+    if not isinstance(data, list) or not data:
         return False
 
-    if not all(isinstance(item, dict) for item in data):
+    it = iter(data)
+    first = next(it)
+    if type(first) is not dict:
         return False
 
-    # Check if all objects have the same keys
-    if len(data) == 0:
-        return False
+    # One pass: type check and key-view comparison, stopping at the first mismatch
+    first_keys = first.keys()
+    for item in it:
+        if type(item) is not dict or item.keys() != first_keys:
+            return False
+    return True
+
 
-    first_keys = set(data[0].keys())
-    return all(set(item.keys()) == first_keys for item in data)
+def _encode_uniform(data: List, name: str) -> Optional[str]:
+    """
+    Encode an array of objects as a Toon table, checking uniformity as it goes.
+
+    This is the hot loop of the encoder, kept separate from the type
+    dispatch in json_to_toon so it can be optimized on its own.
+
+    Args:
+        data: Non-empty array to encode
+        name: Name for the data structure
+
+    Returns:
+        Toon formatted string, or None if data is not a uniform array of objects
+    """
+    first = data[0]
+    if type(first) is not dict:
+        return None
+
+    keys = list(first)
+    size = len(keys)
+    header = f"{name}[{len(data)}]{{{','.join(keys)}}}:"
+    if not size:
+        # Array of empty objects - there are no cells to emit
+        return header if all(type(item) is dict and not item for item in data) else None
+
+    # One C-level getter pulls a whole row at once
+    getter = itemgetter(*keys)
+    single = size == 1
+
+    # Emit header, separators and cells into one accumulator, joined once
+    parts = [header]
+    append = parts.append
+
+    for item in data:
+        # Same key count and every key present means the same key set
+        if type(item) is not dict or len(item) != size:
+            return None
+        try:
+            values = getter(item)
+        except KeyError:
+            return None
+
+        sep = '\n '
+        for v in ((values,) if single else values):
+            v_str = str(v)
+            append(sep)
+            # Quote values containing commas, spaces or newlines
+            if ',' in v_str or ' ' in v_str or '\n' in v_str:
+                append('"')
+                append(v_str)
+                append('"')
+            else:
+                append(v_str)
+            sep = ','
+
+    return ''.join(parts)
+
+
+def json_to_toon_with_uniform(data: Union[Dict, List], name: str = "data") -> Tuple[str, bool]:
+    """
+    Convert JSON data to Toon format and report whether it was a uniform array.
+
+    Uniformity is checked during the encoding pass rather than by a
+    separate is_uniform_array walk.
+
+    Args:
+        data: JSON data (dict or list)
+        name: Name for the data structure
+
+    Returns:
+        tuple: (toon_str, is_uniform)
+    """
+    if isinstance(data, list) and len(data) > 0:
+        toon_str = _encode_uniform(data, name)
+        if toon_str is None:
+            # Fallback to JSON for non-uniform data
+            return _dumps_indent(data), False
+        return toon_str, True
+
+    return json_to_toon(data, name), False
 
 
 def json_to_toon(data: Union[Dict, List], name: str = "data") -> str:
@@ -59,40 +237,47 @@ def json_to_toon(data: Union[Dict, List], name: str = "data") -> str:
     if isinstance(data, dict):
         # If it's a dict with a single array key, use that
         if len(data) == 1:
-            key = list(data.keys())[0]
+            key = next(iter(data))
             if isinstance(data[key], list):
                 return json_to_toon(data[key], name=key)
 
-        # Otherwise convert dict to single-row format
-        keys = list(data.keys())
-        values = [data[k] for k in keys]
-        return f"{name}[1]{{{','.join(keys)}}}:\n {','.join(str(v) for v in values)}"
+        # Otherwise convert dict to single-row format (keys and values share order)
+        return f"{name}[1]{{{','.join(data)}}}:\n {','.join(map(str, data.values()))}"
 
     if isinstance(data, list) and len(data) > 0:
-        if not is_uniform_array(data):
-            # Fallback to JSON for non-uniform data
-            return json.dumps(data, indent=2)
-
-        # Uniform array - perfect for Toon
-        keys = list(data[0].keys())
-        rows = []
-
-        for item in data:
-            values = [item.get(k, '') for k in keys]
-            # Escape commas in values and quote if necessary
-            formatted_values = []
-            for v in values:
-                v_str = str(v)
-                if ',' in v_str or ' ' in v_str or '\n' in v_str:
-                    v_str = f'"{v_str}"'
-                formatted_values.append(v_str)
-            rows.append(' ' + ','.join(formatted_values))
-
-        header = f"{name}[{len(data)}]{{{','.join(keys)}}}:"
-        return header + '\n' + '\n'.join(rows)
+        # Uniform arrays are perfect for Toon; others fall back to JSON
+        return json_to_toon_with_uniform(data, name)[0]
 
     # Fallback for other types
-    return json.dumps(data, indent=2)
+    return _dumps_indent(data)
+
+
+def _coerce(value: str) -> Union[int, float, str]:
+    """
+    Convert a Toon cell to int or float if it is numeric.
+
+    Only values that start like a number pay for a conversion attempt;
+    everything else is returned as-is without raising.
+
+    Args:
+        value: Raw cell text
+
+    Returns:
+        int, float, or the original string
+    """
+    if value[:1] not in _NUMERIC_START:
+        return value
+
+    try:
+        return int(value)
+    except ValueError:
+        pass
+    try:
+        number = float(value)
+    except ValueError:
+        return value
+    # inf and nan are not valid JSON numbers, so those cells stay text
+    return number if math.isfinite(number) else value
 
 
 def toon_to_json(toon_str: str) -> Union[Dict, List]:
@@ -114,7 +299,7 @@ def toon_to_json(toon_str: str) -> Union[Dict, List]:
     if '{' not in header or '}' not in header:
         # Not valid Toon format, try parsing as JSON
         try:
-            return json.loads(toon_str)
+            return _loads(toon_str)
         except json.JSONDecodeError:
             return {"error": "Invalid Toon format"}
 
@@ -123,49 +308,113 @@ def toon_to_json(toon_str: str) -> Union[Dict, List]:
     fields_end = header.index('}')
     fields = [f.strip() for f in header[fields_start:fields_end].split(',')]
 
-    # Parse data rows
+    # Parse data rows with the C csv reader; it handles quoted values,
+    # including quoted newlines. Values are stripped on both sides, as the
+    # indent and any padding around commas are not part of the data
     result = []
-    for line in lines[1:]:
-        if not line.strip():
-            continue
-
-        # Simple CSV parsing (handles basic quoted values)
-        values = []
-        current = ""
-        in_quotes = False
-
-        for char in line.strip():
-            if char == '"':
-                in_quotes = not in_quotes
-            elif char == ',' and not in_quotes:
-                values.append(current.strip())
-                current = ""
-            else:
-                current += char
-
-        if current:
-            values.append(current.strip())
-
-        # Create object
+    body = lines[1:]
+    try:
+        rows = list(csv.reader(io.StringIO('\n'.join(body)), skipinitialspace=True, strict=True))
+    except csv.Error:
+        # A stray quote would swallow every later row; read each line on its own
+        rows = [next(csv.reader((line,), skipinitialspace=True), []) for line in body]
+    for values in rows:
+        # Create object (blank lines yield no values and are skipped)
         if len(values) == len(fields):
             obj = {}
             for i, field in enumerate(fields):
-                value = values[i]
-                # Try to convert to int/float if possible
-                try:
-                    if '.' in value:
-                        obj[field] = float(value)
-                    else:
-                        obj[field] = int(value)
-                except ValueError:
-                    obj[field] = value
+                obj[field] = _coerce(values[i].strip())
             result.append(obj)
 
     return result
 
 
+def _analyze(data: Union[Dict, List], name: str = "data") -> Tuple[str, str, bool, int, int]:
+    """
+    Serialize data as JSON and Toon once, for the tools to share.
+
+    Results are kept in a small LRU cache, so an MCP client that asks for
+    a recommendation and then the compression of the same payload only
+    encodes it once. Serializing is cheaper than sizing the JSON
+    structurally in Python, so every tool goes through here by default.
+
+    Args:
+        data: JSON data to analyze
+        name: Name for the data structure
+
+    Returns:
+        tuple: (json_str, toon_str, is_uniform, json_tokens, toon_tokens)
+    """
+    # Compact JSON is both the size baseline Toon has to beat and the cache
+    # key; it keeps the original key order, which Toon output depends on
+    json_str = _dumps(data)
+    # A tuple shares json_str with the cached result instead of copying it
+    key = (name, json_str)
+    cached = _analysis_cache.get(key)
+    if cached is not None:
+        _analysis_cache.move_to_end(key)
+        return cached
+
+    toon_str, is_uniform = json_to_toon_with_uniform(data, name)
+    result = (json_str, toon_str, is_uniform, estimate_tokens(json_str), estimate_tokens(toon_str))
+
+    if len(json_str) <= _ANALYSIS_CACHE_MAX_CHARS and len(toon_str) <= _ANALYSIS_CACHE_MAX_CHARS:
+        _analysis_cache[key] = result
+        if len(_analysis_cache) > _ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+    return result
+
+
+def _compress_impl(
+    toon_output: str, is_uniform: bool, original_tokens: int, toon_tokens: int
+) -> Dict[str, Any]:
+    """
+    Build the compress_to_toon result from already computed values.
+
+    Returns:
+        Dict in the compress_to_toon result format
+    """
+    savings = ((original_tokens - toon_tokens) / original_tokens * 100) if original_tokens > 0 else 0
+
+    return {
+        "toon": toon_output,
+        "original_tokens": original_tokens,
+        "toon_tokens": toon_tokens,
+        "savings_percent": round(savings, 2),
+        "is_uniform": is_uniform
+    }
+
+
+def _compare_impl(
+    json_str: str, toon_str: str, is_uniform: bool, json_tokens: int, toon_tokens: int
+) -> Dict[str, Any]:
+    """
+    Build the compare_token_usage result from already computed values.
+
+    Returns:
+        Dict in the compare_token_usage result format
+    """
+    savings_tokens = json_tokens - toon_tokens
+    savings_percent = (savings_tokens / json_tokens * 100) if json_tokens > 0 else 0
+
+    recommendation = "Use Toon" if is_uniform and savings_percent > 10 else "Use JSON"
+
+    return {
+        "json_format": json_str,
+        "toon_format": toon_str,
+        "json_tokens": json_tokens,
+        "toon_tokens": toon_tokens,
+        "savings_tokens": savings_tokens,
+        "savings_percent": round(savings_percent, 2),
+        "is_uniform": is_uniform,
+        "recommendation": recommendation
+    }
+
+
 @mcp.tool()
-def compress_to_toon(data: Union[Dict, List], name: str = "data") -> Dict[str, Any]:
+def compress_to_toon(
+    data: Union[Dict, List], name: str = "data", estimate_only: bool = False
+) -> Dict[str, Any]:
     """
     Convert JSON data to Toon format to reduce token usage.
 
@@ -175,6 +424,11 @@ def compress_to_toon(data: Union[Dict, List], name: str = "data") -> Dict[str, A
     Args:
         data: JSON data to compress (dict or list)
         name: Optional name for the data structure (default: "data")
+        estimate_only: Size the original JSON structurally instead of
+            serializing and caching it (default: False). Skips building the
+            compact JSON text; non-uniform data is still returned as indented
+            JSON in toon. Exact unless strings need JSON escaping, in which
+            case original_tokens is slightly low.
 
     Returns:
         Dict containing:
@@ -184,21 +438,36 @@ def compress_to_toon(data: Union[Dict, List], name: str = "data") -> Dict[str, A
         - savings_percent: Percentage of tokens saved
         - is_uniform: Whether data is uniform (ideal for Toon)
     """
-    original_json = json.dumps(data, indent=2)
-    original_tokens = estimate_tokens(original_json)
+    if estimate_only:
+        toon_output, is_uniform = json_to_toon_with_uniform(data, name)
+        original_tokens = _estimate_json_chars(data) // 4
+        toon_tokens = estimate_tokens(toon_output)
+    else:
+        _, toon_output, is_uniform, original_tokens, toon_tokens = _analyze(data, name)
+    return _compress_impl(toon_output, is_uniform, original_tokens, toon_tokens)
 
-    toon_output = json_to_toon(data, name)
-    toon_tokens = estimate_tokens(toon_output)
 
-    savings = ((original_tokens - toon_tokens) / original_tokens * 100) if original_tokens > 0 else 0
+@mcp.tool()
+def compress_to_toon_raw(raw_json: str, name: str = "data") -> Dict[str, Any]:
+    """
+    Convert a JSON string to Toon format to reduce token usage.
 
-    return {
-        "toon": toon_output,
-        "original_tokens": original_tokens,
-        "toon_tokens": toon_tokens,
-        "savings_percent": round(savings, 2),
-        "is_uniform": is_uniform_array(data) if isinstance(data, list) else False
-    }
+    Same as compress_to_toon, but takes the JSON text as sent by the client.
+    Tokens are counted on that text directly instead of re-serializing
+    the parsed data.
+
+    Args:
+        raw_json: JSON text to compress
+        name: Optional name for the data structure (default: "data")
+
+    Returns:
+        Dict with the same fields as compress_to_toon
+    """
+    data = _loads(raw_json)
+    toon_output, is_uniform = json_to_toon_with_uniform(data, name)
+    return _compress_impl(
+        toon_output, is_uniform, estimate_tokens(raw_json), estimate_tokens(toon_output)
+    )
 
 
 @mcp.tool()
@@ -252,28 +521,28 @@ def compare_token_usage(data: Union[Dict, List], name: str = "data") -> Dict[str
         - savings_percent: Percentage savings
         - recommendation: Whether to use Toon for this data
     """
-    json_str = json.dumps(data, indent=2)
-    json_tokens = estimate_tokens(json_str)
+    return _compare_impl(*_analyze(data, name))
 
-    toon_str = json_to_toon(data, name)
-    toon_tokens = estimate_tokens(toon_str)
 
-    savings_tokens = json_tokens - toon_tokens
-    savings_percent = (savings_tokens / json_tokens * 100) if json_tokens > 0 else 0
+@mcp.tool()
+def compare_token_usage_raw(raw_json: str, name: str = "data") -> Dict[str, Any]:
+    """
+    Compare token usage between a JSON string and its Toon format.
 
-    is_uniform = is_uniform_array(data) if isinstance(data, list) else False
-    recommendation = "Use Toon" if is_uniform and savings_percent > 10 else "Use JSON"
+    Same as compare_token_usage, but takes the JSON text as sent by the
+    client, which is reported and measured as-is without re-serializing.
 
-    return {
-        "json_format": json_str,
-        "toon_format": toon_str,
-        "json_tokens": json_tokens,
-        "toon_tokens": toon_tokens,
-        "savings_tokens": savings_tokens,
-        "savings_percent": round(savings_percent, 2),
-        "is_uniform": is_uniform,
-        "recommendation": recommendation
-    }
+    Args:
+        raw_json: JSON text to analyze
+        name: Optional name for the data structure
+
+    Returns:
+        Dict with the same fields as compare_token_usage
+    """
+    toon_str, is_uniform = json_to_toon_with_uniform(_loads(raw_json), name)
+    return _compare_impl(
+        raw_json, toon_str, is_uniform, estimate_tokens(raw_json), estimate_tokens(toon_str)
+    )
 
 
 @mcp.tool()
@@ -310,9 +579,9 @@ def should_use_toon(data: Union[Dict, List]) -> Dict[str, Any]:
             "reason": "Array is empty."
         }
 
-    uniform = is_uniform_array(data)
-
-    if not uniform:
+    # The key walk stops at the first mismatch, so only uniform arrays pay
+    # for serialization and a cache entry
+    if not is_uniform_array(data):
         return {
             "should_use": False,
             "is_uniform": False,
@@ -320,28 +589,24 @@ def should_use_toon(data: Union[Dict, List]) -> Dict[str, Any]:
             "reason": "Array objects have inconsistent fields. Toon requires uniform structure."
         }
 
-    # Calculate estimated savings
-    json_str = json.dumps(data, indent=2)
-    toon_str = json_to_toon(data)
+    # Shares the cached analysis with a following compress_to_toon call
+    _, _, _, json_tokens, toon_tokens = _analyze(data)
 
-    json_tokens = estimate_tokens(json_str)
-    toon_tokens = estimate_tokens(toon_str)
+    # Recommend if savings > 10%, decided in exact integer math
+    should_use = (json_tokens - toon_tokens) * 100 > 10 * json_tokens
 
     savings_percent = ((json_tokens - toon_tokens) / json_tokens * 100) if json_tokens > 0 else 0
 
-    should_use = savings_percent > 10  # Recommend if savings > 10%
-
-    reason = f"Uniform array with {len(data)} items. " + \
-             f"Expected savings: ~{round(savings_percent, 1)}%. " + \
-             ("Recommended for token efficiency." if should_use else "Minimal benefit.")
+    template = _REASON_RECOMMENDED if should_use else _REASON_MINIMAL
+    count = len(data)
 
     return {
         "should_use": should_use,
         "is_uniform": True,
         "estimated_savings_percent": round(savings_percent, 2),
-        "reason": reason,
-        "array_size": len(data),
-        "field_count": len(data[0].keys()) if len(data) > 0 else 0
+        "reason": template.format(count, round(savings_percent, 1)),
+        "array_size": count,
+        "field_count": len(data[0])
     }
 
 
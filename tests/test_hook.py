@@ -0,0 +1,278 @@
+"""Tests for the Claude Code compression hook."""
+
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+# The hook is a standalone script installed by path, not a package module
+_HOOK_PATH = Path(__file__).resolve().parent.parent / "hooks" / "compress_prompt.py"
+_spec = importlib.util.spec_from_file_location("compress_prompt", _HOOK_PATH)
+hook = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(hook)
+
+
+def _spans(text):
+    """Return detected block positions without the parsed data."""
+    return [(start, end) for start, end, _ in hook.detect_json_in_text(text)]
+
+
+class TestFindJsonSpans:
+    """Test the single-pass bracket scanner."""
+
+    def test_nested_spans_kept_as_children(self):
+        """Test that spans closed inside a bracket are kept as its children."""
+        text = '{"a": [1, 2], "b": {"c": 3}}'
+        spans = hook.find_json_spans(text)
+        assert len(spans) == 1
+        start, end, children = spans[0]
+        assert (start, end) == (0, len(text))
+        assert [(s, e) for s, e, _ in children] == [(6, 12), (19, 27)]
+
+    def test_unclosed_prose_bracket(self):
+        """Test that spans inside a never-closed bracket are promoted."""
+        text = 'Notes (see [1 and {"a": 1} then [2, 3]'
+        spans = hook.find_json_spans(text)
+        assert [text[s:e] for s, e, _ in spans] == ['{"a": 1}', '[2, 3]']
+
+    def test_brackets_inside_strings_ignored(self):
+        """Test that brackets inside JSON strings do not close spans."""
+        text = '[{"note": "a ] b } c"}]'
+        spans = hook.find_json_spans(text)
+        assert [(s, e) for s, e, _ in spans] == [(0, len(text))]
+
+    def test_escaped_quotes(self):
+        """Test that escaped quotes do not end string state."""
+        text = '[{"note": "say \\"]\\" now"}]'
+        spans = hook.find_json_spans(text)
+        assert [(s, e) for s, e, _ in spans] == [(0, len(text))]
+
+
+class TestDetectJsonInText:
+    """Test JSON block detection in prompts."""
+
+    def test_plain_array(self):
+        """Test detection of a bare array of objects."""
+        text = 'Data: [{"id": 1}, {"id": 2}, {"id": 3}] thanks'
+        assert _spans(text) == [(6, 39)]
+
+    def test_array_wrapped_in_object(self):
+        """Test that an array inside a small wrapper object is detected."""
+        text = ('Here: {"users": [{"id": 1, "name": "A"}, {"id": 2, "name": "B"}, '
+                '{"id": 3, "name": "C"}]}')
+        blocks = hook.detect_json_in_text(text)
+        assert [(s, e) for s, e, _ in blocks] == [(16, 88)]
+        assert blocks[0][2][2] == {"id": 3, "name": "C"}
+
+    def test_pretty_printed_wrapper(self):
+        """Test a pretty-printed {"data": [...]} response."""
+        text = 'Response:\n{\n  "data": [\n    {"id": 1},\n    {"id": 2}\n  ]\n}\n'
+        blocks = hook.detect_json_in_text(text)
+        assert len(blocks) == 1
+        assert blocks[0][2] == [{"id": 1}, {"id": 2}]
+
+    def test_array_nested_in_array(self):
+        """Test that [[{...}]] yields the inner array of objects."""
+        text = 'x [[{"a": 1}, {"a": 2}]] y'
+        assert _spans(text) == [(3, 23)]
+
+    def test_arrays_in_large_object(self):
+        """Test that arrays are preferred over an enclosing object."""
+        text = '{"a": 1, "b": 2, "rows": [{"x": 1}, {"x": 2}]}'
+        assert _spans(text) == [(25, 45)]
+
+    def test_object_fallback(self):
+        """Test that an object with more than two keys is detected."""
+        text = 'Config {"a": 1, "b": {"c": 1, "d": 2, "e": 3}, "f": 3} done'
+        blocks = hook.detect_json_in_text(text)
+        # Only the outermost object is kept, never overlapping children
+        assert [(s, e) for s, e, _ in blocks] == [(7, 54)]
+
+    def test_unclosed_prose_bracket(self):
+        """Test detection after a bracket in prose that never closes."""
+        text = 'Items (see [below: [{"id": 1}, {"id": 2}]'
+        assert _spans(text) == [(19, 41)]
+
+    def test_closing_bracket_inside_string(self):
+        """Test that ']' inside a string value does not split the array."""
+        text = '[{"s": "]"}, {"s": "x]y"}]'
+        blocks = hook.detect_json_in_text(text)
+        assert blocks == [(0, len(text), [{"s": "]"}, {"s": "x]y"}])]
+
+    def test_escaped_quotes(self):
+        """Test arrays whose strings contain escaped quotes."""
+        text = 'Quote: [{"q": "he said \\"hi]\\""}, {"q": "ok"}]'
+        blocks = hook.detect_json_in_text(text)
+        assert len(blocks) == 1
+        assert blocks[0][2][0] == {"q": 'he said "hi]"'}
+
+    def test_prose_quote_inside_bracket(self):
+        """Test that an inch mark inside brackets does not hide later JSON."""
+        text = ('Monitor [27" IPS] specs: [{"id":1,"size":27},{"id":2,"size":32},'
+                '{"id":3,"size":24}]')
+        blocks = hook.detect_json_in_text(text)
+        assert [(s, e) for s, e, _ in blocks] == [(25, len(text))]
+        assert len(blocks[0][2]) == 3
+
+    def test_prose_quote_in_unclosed_bracket(self):
+        """Test that a quoted phrase spanning a stray bracket is not a string."""
+        text = 'He said "hi [there" and [{"id": 1}, {"id": 2}]'
+        assert _spans(text) == [(24, len(text))]
+
+    def test_wide_integers_kept_exact(self):
+        """Test that integers wider than 64 bits survive parsing unchanged."""
+        text = 'Ids: [{"a": 123456789012345678901234567890}, {"a": 1}]'
+        blocks = hook.detect_json_in_text(text)
+        assert blocks[0][2] == [{"a": 123456789012345678901234567890}, {"a": 1}]
+
+    def test_plain_prose(self):
+        """Test that prose without JSON yields nothing."""
+        assert hook.detect_json_in_text("Fix the [bug] in {module} please") == []
+
+
+class TestEstimateSizes:
+    """Test the single-walk size estimate used before encoding."""
+
+    def test_json_size_matches_dumps(self):
+        """Test that the JSON estimate equals the compact JSON length."""
+        cases = [
+            [{"a": 1}],
+            [{"id": i, "v": i} for i in range(10)],
+            [{"id": i, "name": f"user{i}", "ok": i % 2 == 0, "score": i / 4, "x": None}
+             for i in range(25)],
+        ]
+        for data in cases:
+            json_size, _ = hook._estimate_sizes(data)
+            assert json_size == len(hook.json_dumps(data))
+
+    def test_nested_values_not_estimated(self):
+        """Test that nested values return None."""
+        assert hook._estimate_sizes([{"a": [1, 2]}, {"a": [3]}]) is None
+
+
+def _fake_encode(value):
+    """Minimal stand-in for toon_python.encode on {name: uniform rows}."""
+    (name, rows), = value.items()
+    keys = list(rows[0])
+    lines = [f"{name}[{len(rows)}]{{{','.join(keys)}}}:"]
+    lines += [" " + ",".join(str(row[k]) for k in keys) for row in rows]
+    return "\n".join(lines)
+
+
+@pytest.fixture
+def toon(monkeypatch):
+    """Stub the toon-python encoder so the compression path runs without it."""
+    monkeypatch.setattr(hook, "encode", _fake_encode)
+    monkeypatch.setattr(hook, "TOON_AVAILABLE", True)
+
+
+def _users(count):
+    """Build a uniform array that compresses well."""
+    return [
+        {"id": i, "name": f"user{i}", "email": f"user{i}@example.com", "role": "admin"}
+        for i in range(count)
+    ]
+
+
+class TestEstimateTokens:
+    """Test the UTF-8 aware token estimate."""
+
+    def test_ascii(self):
+        """Test that ASCII text counts four characters per token."""
+        assert hook.estimate_tokens("abcdefgh") == 2
+
+    def test_cjk_counts_utf8_bytes(self):
+        """Test that CJK text is sized by its UTF-8 length, not characters."""
+        # 4 characters, 3 bytes each
+        assert hook.estimate_tokens("你好世界") == 3
+
+
+class TestEvaluateCompression:
+    """Test the compression decision for a single block."""
+
+    def test_unavailable_encoder(self, monkeypatch):
+        """Test that nothing is compressed without toon-python."""
+        monkeypatch.setattr(hook, "TOON_AVAILABLE", False)
+        assert hook.evaluate_compression(_users(10)) is None
+
+    def test_rejected_blocks(self, toon):
+        """Test blocks below the thresholds or with mixed fields."""
+        assert hook.evaluate_compression(_users(2)) is None
+        assert hook.evaluate_compression({"a": 1, "b": 2, "c": 3}) is None
+        assert hook.evaluate_compression([{"a": 1}, {"b": 2}, {"a": 3}]) is None
+        # Uniform, but under the 64-character size floor
+        assert hook.evaluate_compression([{"a": 1}, {"a": 2}, {"a": 3}]) is None
+
+    def test_compressible_block(self, toon):
+        """Test that the Toon output and token counts come from one evaluation."""
+        data = _users(10)
+        toon_output, original_tokens, toon_tokens = hook.evaluate_compression(data)
+
+        assert toon_output == _fake_encode({"data": data})
+        assert original_tokens == hook.estimate_tokens(hook.json_dumps(data))
+        assert toon_tokens == hook.estimate_tokens(toon_output)
+
+    def test_evaluate_blocks_keeps_order(self, toon):
+        """Test that sequential block evaluation returns results in block order."""
+        blocks = [(0, 1, _users(2)), (2, 3, _users(5)), (4, 5, _users(3))]
+        results = hook.evaluate_blocks(blocks)
+
+        assert results[0] is None
+        assert results[1][0].startswith("data[5]{id,name,email,role}:")
+        assert results[2][0].startswith("data[3]{id,name,email,role}:")
+
+
+class TestCompressPrompt:
+    """Test prompt rewriting."""
+
+    def test_multiple_blocks(self, toon):
+        """Test that compressible blocks are replaced in place and others kept."""
+        first, small, second = _users(4), [{"id": 1}], _users(6)
+        prompt = (
+            f"First {json.dumps(first)} then {json.dumps(small)} "
+            f"and last {json.dumps(second)} done."
+        )
+
+        modified, was_compressed, stats = hook.compress_prompt(prompt)
+
+        expected = [hook.evaluate_compression(first), hook.evaluate_compression(second)]
+        assert was_compressed is True
+        assert stats == {
+            "compressed_blocks": 2,
+            "total_tokens_saved": sum(orig - toon for _, orig, toon in expected),
+        }
+        assert modified.startswith("First \n[AUTOMATICALLY COMPRESSED BY TOONER HOOK")
+        assert f" then {json.dumps(small)} and last \n" in modified
+        assert modified.endswith("to save tokens]\n done.")
+        assert modified.index(expected[0][0]) < modified.index(expected[1][0])
+
+    def test_no_json(self, toon):
+        """Test that prompts without JSON are returned unchanged."""
+        assert hook.compress_prompt("Just a question") == ("Just a question", False, {})
+
+    def test_missing_encoder_reports_error(self, monkeypatch):
+        """Test the error stat that triggers the interpreter re-exec."""
+        monkeypatch.setattr(hook, "load_toon", lambda: False)
+        prompt = f"Data: {json.dumps(_users(5))}"
+
+        error = {"error": "toon-python not installed"}
+        assert hook.compress_prompt(prompt) == (prompt, False, error)
+
+
+class TestLogToFile:
+    """Test the cached log file descriptor."""
+
+    def test_reuses_descriptor(self, tmp_path):
+        """Test that repeated messages share one open descriptor."""
+        log_file = tmp_path / "logs" / "hook.log"
+        try:
+            hook.log_to_file("first", log_file)
+            fd = hook._log_fds[log_file]
+            hook.log_to_file("second", log_file)
+
+            assert hook._log_fds[log_file] == fd
+            lines = log_file.read_text().splitlines()
+            assert [line.split("] ", 1)[1] for line in lines] == ["first", "second"]
+        finally:
+            hook._close_logs()
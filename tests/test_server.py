@@ -1,14 +1,23 @@
 """Tests for Tooner MCP server tools."""
 
+import json
+
+import src.tooner.server as server
 from src.tooner.server import (
     json_to_toon,
+    json_to_toon_with_uniform,
     toon_to_json,
     is_uniform_array,
     estimate_tokens,
     compress_to_toon,
+    compress_to_toon_raw,
     parse_from_toon,
     compare_token_usage,
+    compare_token_usage_raw,
     should_use_toon,
+    _analyze,
+    _analysis_cache,
+    _estimate_json_chars,
 )
 
 
@@ -20,6 +29,17 @@ class TestUtilityFunctions:
         assert estimate_tokens("hello") > 0
         assert estimate_tokens("a" * 100) > estimate_tokens("a" * 50)
 
+    def test_estimate_json_chars_matches_dumps(self):
+        """Test structural JSON size estimate against real serialization."""
+        data = [
+            {"id": 1, "name": "Alice", "score": 9.5, "ok": True, "tags": ["a", "b"]},
+            {"id": 2, "name": "Bob", "score": -1, "ok": False, "tags": []},
+            {"id": 3, "name": "Carol", "score": 0, "ok": None, "tags": [{"x": {}}]},
+        ]
+        compact = (",", ":")
+        assert _estimate_json_chars(data) == len(json.dumps(data, separators=compact))
+        assert _estimate_json_chars({}) == len(json.dumps({}, separators=compact))
+
     def test_is_uniform_array_valid(self):
         """Test uniform array detection with valid data."""
         data = [
@@ -46,6 +66,9 @@ class TestUtilityFunctions:
         # List of non-dicts
         assert is_uniform_array([1, 2, 3]) is False
 
+        # Dict followed by a non-dict
+        assert is_uniform_array([{"id": 1}, [1]]) is False
+
 
 class TestToonConversion:
     """Test Toon format conversion."""
@@ -70,6 +93,30 @@ class TestToonConversion:
         assert "user[1]{id,name}:" in result
         assert "1,Alice" in result
 
+    def test_json_to_toon_single_field(self):
+        """Test uniform arrays with one field or no fields."""
+        assert json_to_toon([{"id": 1}, {"id": 2}], name="ids") == "ids[2]{id}:\n 1\n 2"
+        assert json_to_toon([{}, {}], name="empty") == "empty[2]{}:"
+
+    def test_json_to_toon_with_uniform(self):
+        """Test that uniformity is reported from the encoding pass."""
+        data = [{"id": 1, "name": "Alice"}, {"id": 2, "name": "Bob"}]
+        toon_str, is_uniform = json_to_toon_with_uniform(data, name="users")
+        assert is_uniform is True
+        assert toon_str == json_to_toon(data, name="users")
+
+        # Same key count but different keys
+        _, is_uniform = json_to_toon_with_uniform([{"id": 1, "a": 1}, {"id": 2, "b": 2}])
+        assert is_uniform is False
+
+        # Extra key in a later row
+        _, is_uniform = json_to_toon_with_uniform([{"id": 1}, {"id": 2, "name": "Bob"}])
+        assert is_uniform is False
+
+        # Mixed item types and dicts
+        assert json_to_toon_with_uniform([{"id": 1}, 2])[1] is False
+        assert json_to_toon_with_uniform({"id": 1})[1] is False
+
     def test_toon_to_json_uniform_array(self):
         """Test Toon to JSON conversion."""
         toon_str = """users[2]{id,name,role}:
@@ -85,6 +132,47 @@ class TestToonConversion:
         assert result[1]["id"] == 2
         assert result[1]["name"] == "Bob"
 
+    def test_toon_to_json_numeric_coercion(self):
+        """Test that only numeric cells are converted."""
+        toon_str = """items[1]{a,b,c,d,e}:
+ 7,-1.5,1e3,v2,12abc"""
+
+        assert toon_to_json(toon_str) == [{"a": 7, "b": -1.5, "c": 1000.0, "d": "v2", "e": "12abc"}]
+
+        # Non-finite floats are not JSON numbers
+        toon_str = """items[1]{a,b,c,d}:
+ +inf,-nan,-Infinity,1e500"""
+
+        assert toon_to_json(toon_str) == [{"a": "+inf", "b": "-nan", "c": "-Infinity", "d": "1e500"}]
+
+    def test_toon_to_json_strips_values(self):
+        """Test that padding around values is stripped on both sides."""
+        toon_str = "users[2]{id,name}:\n 1,Alice \n 2, Bob"
+
+        assert toon_to_json(toon_str) == [{"id": 1, "name": "Alice"}, {"id": 2, "name": "Bob"}]
+
+    def test_toon_round_trip_quoted_values(self):
+        """Test that quoted commas, spaces and newlines survive a round trip."""
+        data = [
+            {"id": 1, "name": "Alice Smith", "note": "a,b"},
+            {"id": 2, "name": "Bob", "note": "line1\nline2"},
+        ]
+
+        assert toon_to_json(json_to_toon(data)) == data
+
+    def test_toon_to_json_stray_quote(self):
+        """Test that an unterminated quote does not swallow later rows."""
+        toon_str = 'data[3]{a,b}:\n 1,"x\n 2,y\n 3,z'
+
+        assert toon_to_json(toon_str) == [
+            {"a": 1, "b": "x"}, {"a": 2, "b": "y"}, {"a": 3, "b": "z"}
+        ]
+
+        # The encoder leaves a lone leading quote unquoted
+        result = toon_to_json(json_to_toon([{"a": '"x'}, {"a": "y"}, {"a": "z"}]))
+        assert len(result) == 3
+        assert result[1:] == [{"a": "y"}, {"a": "z"}]
+
     def test_json_to_toon_with_commas(self):
         """Test handling of values with commas."""
         data = [
@@ -96,6 +184,28 @@ class TestToonConversion:
         # Should handle comma in name
         assert "users[2]{id,name}:" in result
 
+    def test_json_to_toon_quotes_values(self):
+        """Test exact output with quoted and unquoted values."""
+        data = [
+            {"id": 1, "name": "Alice Smith", "tags": "a,b"},
+            {"id": 2, "name": "Bob", "tags": "c"},
+        ]
+        result = json_to_toon(data, name="users")
+
+        assert result == 'users[2]{id,name,tags}:\n 1,"Alice Smith","a,b"\n 2,Bob,c'
+
+    def test_json_to_toon_quote_triggers(self):
+        """Test that only commas, spaces and newlines force quoting."""
+        data = [
+            {"v": "a\nb"},
+            {"v": "tab\there"},
+            {"v": 1.5},
+            {"v": True},
+        ]
+        result = json_to_toon(data, name="items")
+
+        assert result == 'items[4]{v}:\n "a\nb"\n tab\there\n 1.5\n True'
+
 
 class TestMCPTools:
     """Test MCP tool functions."""
@@ -115,6 +225,15 @@ class TestMCPTools:
         assert result["is_uniform"] is True
         assert result["toon_tokens"] < result["original_tokens"]
 
+    def test_compress_to_toon_estimate_matches_serialized(self):
+        """Test that the structural estimate agrees with real serialization."""
+        data = [{"id": i, "name": f"User{i}", "active": i % 2 == 0} for i in range(20)]
+
+        estimated = compress_to_toon(data, name="users", estimate_only=True)
+        serialized = compress_to_toon(data, name="users")
+
+        assert estimated == serialized
+
     def test_parse_from_toon(self):
         """Test parse_from_toon tool."""
         toon_str = """users[2]{id,name}:
@@ -142,6 +261,28 @@ class TestMCPTools:
         assert "savings_percent" in result
         assert "recommendation" in result
 
+    def test_raw_json_tools(self):
+        """Test the raw JSON variants against their parsed counterparts."""
+        data = [{"id": i, "name": f"User{i}"} for i in range(10)]
+        raw_json = json.dumps(data)
+
+        result = compress_to_toon_raw(raw_json, name="users")
+        assert result["toon"] == compress_to_toon(data, name="users")["toon"]
+        assert result["original_tokens"] == estimate_tokens(raw_json)
+        assert result["is_uniform"] is True
+
+        result = compare_token_usage_raw(raw_json, name="users")
+        assert result["json_format"] == raw_json
+        assert result["json_tokens"] == estimate_tokens(raw_json)
+        assert result["recommendation"] == "Use Toon"
+
+    def test_raw_json_keeps_wide_integers(self):
+        """Test that integers wider than 64 bits are not parsed as floats."""
+        raw_json = '[{"id": 123456789012345678901234567890}, {"id": 1}, {"id": 2}]'
+
+        result = compress_to_toon_raw(raw_json, name="ids")
+        assert result["toon"] == "ids[3]{id}:\n 123456789012345678901234567890\n 1\n 2"
+
     def test_should_use_toon_uniform(self):
         """Test should_use_toon with uniform data."""
         data = [
@@ -176,6 +317,59 @@ class TestMCPTools:
         assert "not an array" in result["reason"].lower()
 
 
+class TestAnalysisCache:
+    """Test caching of shared JSON/Toon analysis."""
+
+    def test_repeated_analysis_is_cached(self):
+        """Test that the same payload is only serialized once."""
+        data = [{"id": i, "name": f"User{i}"} for i in range(5)]
+        assert _analyze(data, "users") is _analyze(list(data), "users")
+
+    def test_cache_respects_key_order_and_name(self):
+        """Test that payloads differing only in key order are not conflated."""
+        first = compare_token_usage([{"a": 1, "b": 2}], name="rows")
+        second = compare_token_usage([{"b": 2, "a": 1}], name="rows")
+        renamed = compare_token_usage([{"a": 1, "b": 2}], name="other")
+
+        assert first["toon_format"].startswith("rows[1]{a,b}:")
+        assert second["toon_format"].startswith("rows[1]{b,a}:")
+        assert renamed["toon_format"].startswith("other[1]{a,b}:")
+
+    def test_recommend_then_compress_shares_cache(self):
+        """Test that should_use_toon and compress_to_toon share one entry."""
+        data = [{"id": i, "email": f"user{i}@example.com"} for i in range(10)]
+        _analysis_cache.clear()
+
+        assert should_use_toon(data)["should_use"] is True
+        compress_to_toon(data)
+
+        assert len(_analysis_cache) == 1
+
+    def test_non_uniform_verdict_not_cached(self):
+        """Test that should_use_toon rejects mixed arrays without serializing."""
+        _analysis_cache.clear()
+
+        assert should_use_toon([{"a": 1}, {"b": 2}])["is_uniform"] is False
+        assert len(_analysis_cache) == 0
+
+    def test_large_toon_text_not_cached(self, monkeypatch):
+        """Test that the size bound applies to the Toon text as well."""
+        # Compact JSON is 17 characters; the indented fallback is longer
+        data = [{"a": 1}, {"b": 2}]
+        monkeypatch.setattr(server, "_ANALYSIS_CACHE_MAX_CHARS", 20)
+        _analysis_cache.clear()
+
+        compare_token_usage(data)
+        assert len(_analysis_cache) == 0
+
+    def test_cache_key_shares_json_text(self):
+        """Test that the cache key does not hold a second copy of the JSON."""
+        data = [{"id": i, "tag": "key-sharing"} for i in range(5)]
+        json_str = _analyze(data, "rows")[0]
+
+        assert any(key[1] is json_str for key in _analysis_cache)
+
+
 class TestEdgeCases:
     """Test edge cases and error handling."""
 